@@ -0,0 +1 @@
+"""Prompt Injection Interceptor - CLI hook scripts and the scan daemon."""
@@ -13,34 +13,50 @@ Exit codes:
 import json
 import os
 import sys
-from datetime import datetime, timezone
+# Not typing.BinaryIO/TextIO: typing is slow to import, and this runs
+# once per tool call
+from io import BufferedIOBase, TextIOBase
 
 # Add the prompt-injection-interceptor src to path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PII_DIR = os.path.dirname(SCRIPT_DIR)
 sys.path.insert(0, PII_DIR)
 
-from src.injection_detector import InjectionDetector
+try:
+    from hooks import pii_daemon
+except ImportError:
+    # Scan and log in-process rather than fail open on a broken install
+    pii_daemon = None
+from src.injection_detector import InjectionDetector, ScanResult
 
 
-# Initialize detector once
-detector = InjectionDetector()
+# Built on first use, so scans the daemon answers never build it
+_detector: InjectionDetector | None = None
 
 # Log file for security audit
 AUDIT_LOG = os.path.join(PII_DIR, "security-audit.log")
 
+# Cleared once a write fails, so later scans skip building their entries
+_log_enabled = True
+
+# Rule above and below block messages
+_SEP = "=" * 60
+
 
 def log_scan(
     tool_name: str,
     url: str,
     decision: str,
     score: int,
-    detections: list[str],
+    detections: tuple[str, ...],
     content_length: int
 ) -> None:
     """Log scan result to security audit log."""
+    global _log_enabled
+    if not _log_enabled:
+        return
+
     entry = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
         "event": "web_content_scan",
         "cli": "claude",
         "tool": tool_name,
@@ -52,11 +68,38 @@ def log_scan(
     }
 
     try:
-        with open(AUDIT_LOG, "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        if pii_daemon is not None:
+            pii_daemon.log(AUDIT_LOG, entry)
+        else:
+            append_log(entry)
     except OSError:
         # Don't fail the hook if logging fails
-        pass
+        _log_enabled = False
+
+
+def append_log(entry: dict) -> None:
+    """Append entry to the audit log directly, without pii_daemon."""
+    from datetime import datetime, timezone
+
+    entry = {"timestamp": datetime.now(timezone.utc).isoformat(), **entry}
+    # Raw UTF-8 like pii_daemon.encode_json, with lone surrogates escaped
+    with open(AUDIT_LOG, "a", encoding="utf-8", errors="backslashreplace") as f:
+        f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+
+def scan_content(content: str) -> ScanResult:
+    """Scan content via the resident daemon, or in-process without one."""
+    global _detector
+
+    # Only the verdict matters here, so stop scanning once it is a block
+    result = None
+    if pii_daemon is not None:
+        result = pii_daemon.scan(content, first_block=True)
+    if result is None:
+        if _detector is None:
+            _detector = InjectionDetector()
+        result = _detector.scan(content, first_block=True)
+    return result
 
 
 def extract_content(tool_name: str, tool_response: dict) -> tuple[str, str]:
@@ -70,61 +113,74 @@ def extract_content(tool_name: str, tool_response: dict) -> tuple[str, str]:
 
     elif tool_name == "WebSearch":
         results = tool_response.get("results", [])
-        snippets = []
-        for result in results:
-            if "snippet" in result:
-                snippets.append(result["snippet"])
-            if "title" in result:
-                snippets.append(result["title"])
-        content = "\n".join(snippets)
+        content = "\n".join(
+            result[field]
+            for result in results
+            for field in ("snippet", "title")
+            if field in result
+        )
         url = "search_results"
         return content, url
 
     return "", url
 
 
-def output_block_message(url: str, score: int, detections: list[str]) -> None:
-    """Output the block message to stderr."""
-    print("", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-    print("CONTENT BLOCKED: Potential prompt injection detected", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-    print("", file=sys.stderr)
-    print(f"Source: {url}", file=sys.stderr)
-    print(f"Risk Score: {score}", file=sys.stderr)
-    print("", file=sys.stderr)
-    print("Detections:", file=sys.stderr)
-    for detection in detections:
-        print(f"  - {detection}", file=sys.stderr)
-    print("", file=sys.stderr)
-    print("The content has been blocked for your safety.", file=sys.stderr)
-    print("The raw content has NOT been passed to Claude.", file=sys.stderr)
-    print("", file=sys.stderr)
-    print("If you believe this is a false positive, you can:", file=sys.stderr)
-    print("  1. Review the source URL manually", file=sys.stderr)
-    print("  2. Check the security-audit.log for details", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-
-
-def main():
-    """Main hook entry point."""
+def output_block_message(
+    stderr: TextIOBase,
+    url: str,
+    score: int,
+    detections: tuple[str, ...]
+) -> None:
+    """Output the block message to stderr in a single write."""
+    lines = [
+        "",
+        _SEP,
+        "CONTENT BLOCKED: Potential prompt injection detected",
+        _SEP,
+        "",
+        f"Source: {url}",
+        f"Risk Score: {score}",
+        "",
+        "Detections:",
+        *(f"  - {detection}" for detection in detections),
+        "",
+        "The content has been blocked for your safety.",
+        "The raw content has NOT been passed to Claude.",
+        "",
+        "If you believe this is a false positive, you can:",
+        "  1. Review the source URL manually",
+        "  2. Check the security-audit.log for details",
+        _SEP,
+    ]
+    stderr.write("\n".join(lines) + "\n")
+
+
+def main(stdin: BufferedIOBase, stdout: TextIOBase, stderr: TextIOBase) -> int:
+    """Main hook entry point.
+
+    Returns:
+        The exit code: 0 to allow the content, 2 to block it
+    """
     try:
-        data = json.load(sys.stdin)
+        # Invalid UTF-8 becomes lone surrogates, so such content is still
+        # scanned rather than crashing the hook (which lets it through)
+        raw = stdin.read().decode("utf-8", "surrogateescape")
+        data = pii_daemon.decode_json(raw) if pii_daemon else json.loads(raw)
     except json.JSONDecodeError:
-        sys.exit(0)
+        return 0
 
     tool_name = data.get("tool_name", "")
     tool_response = data.get("tool_response", {})
 
     if tool_name not in ("WebFetch", "WebSearch"):
-        sys.exit(0)
+        return 0
 
     content, url = extract_content(tool_name, tool_response)
 
     if not content:
-        sys.exit(0)
+        return 0
 
-    result = detector.scan(content)
+    result = scan_content(content)
 
     log_scan(
         tool_name=tool_name,
@@ -136,11 +192,11 @@ def main():
     )
 
     if not result.is_safe:
-        output_block_message(url, result.score, result.detections)
-        sys.exit(2)
+        output_block_message(stderr, url, result.score, result.detections)
+        return 2
 
-    sys.exit(0)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.stdin.buffer, sys.stdout, sys.stderr))
@@ -24,22 +24,33 @@ Gemini CLI Hook Schema (AfterTool):
 import json
 import os
 import sys
-from datetime import datetime, timezone
+from io import BufferedIOBase, TextIOBase
 
 # Add the prompt-injection-interceptor src to path
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PII_DIR = os.path.dirname(SCRIPT_DIR)
 sys.path.insert(0, PII_DIR)
 
-from src.injection_detector import InjectionDetector
+try:
+    from hooks import pii_daemon
+except ImportError:
+    # Scan and log in-process rather than fail open on a broken install
+    pii_daemon = None
+from src.injection_detector import InjectionDetector, ScanResult
 
 
-# Initialize detector once
-detector = InjectionDetector()
+# Built on first use, so scans the daemon answers never build it
+_detector: InjectionDetector | None = None
 
 # Log file for security audit
 AUDIT_LOG = os.path.join(PII_DIR, "security-audit.log")
 
+# Cleared once a write fails, so later scans skip building their entries
+_log_enabled = True
+
+# Rule above and below block messages
+_SEP = "=" * 60
+
 # Gemini CLI web-related tool names
 GEMINI_WEB_TOOLS = {
     "google_web_search",
@@ -48,19 +59,26 @@ GEMINI_WEB_TOOLS = {
     "browse_web",
 }
 
+# Output fields holding the content, in order of preference
+_SEARCH_FIELDS = ("response", "result", "summary", "text")
+_FETCH_FIELDS = ("content", "body", "html", "text")
+
 
 def log_scan(
     tool_name: str,
     url: str,
     decision: str,
     score: int,
-    detections: list[str],
+    detections: tuple[str, ...],
     content_length: int,
     session_id: str = ""
 ) -> None:
     """Log scan result to security audit log."""
+    global _log_enabled
+    if not _log_enabled:
+        return
+
     entry = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
         "event": "web_content_scan",
         "cli": "gemini",
         "session_id": session_id,
@@ -73,10 +91,37 @@ def log_scan(
     }
 
     try:
-        with open(AUDIT_LOG, "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        if pii_daemon is not None:
+            pii_daemon.log(AUDIT_LOG, entry)
+        else:
+            append_log(entry)
     except OSError:
-        pass
+        _log_enabled = False
+
+
+def append_log(entry: dict) -> None:
+    """Append entry to the audit log directly, without pii_daemon."""
+    from datetime import datetime, timezone
+
+    entry = {"timestamp": datetime.now(timezone.utc).isoformat(), **entry}
+    # Raw UTF-8 like pii_daemon.encode_json, with lone surrogates escaped
+    with open(AUDIT_LOG, "a", encoding="utf-8", errors="backslashreplace") as f:
+        f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+
+def scan_content(content: str) -> ScanResult:
+    """Scan content via the resident daemon, or in-process without one."""
+    global _detector
+
+    # Only the verdict matters here, so stop scanning once it is a block
+    result = None
+    if pii_daemon is not None:
+        result = pii_daemon.scan(content, first_block=True)
+    if result is None:
+        if _detector is None:
+            _detector = InjectionDetector()
+        result = _detector.scan(content, first_block=True)
+    return result
 
 
 def extract_content(tool_name: str, tool_input: dict, tool_output) -> tuple[str, str]:
@@ -103,28 +148,14 @@ def extract_content(tool_name: str, tool_input: dict, tool_output) -> tuple[str,
         query = tool_input.get("query", "") if isinstance(tool_input, dict) else ""
         url = f"search:{query}"
 
-        content = tool_output.get("response", "")
-        if not content:
-            content = tool_output.get("result", "")
-        if not content:
-            content = tool_output.get("summary", "")
-        if not content:
-            content = tool_output.get("text", "")
-
+        content = next((tool_output[f] for f in _SEARCH_FIELDS if tool_output.get(f)), "")
         return content, url
 
     elif tool_name in ("web_fetch", "fetch_url", "browse_web"):
         if isinstance(tool_input, dict):
             url = tool_input.get("url", tool_input.get("uri", "unknown"))
 
-        content = tool_output.get("content", "")
-        if not content:
-            content = tool_output.get("body", "")
-        if not content:
-            content = tool_output.get("html", "")
-        if not content:
-            content = tool_output.get("text", "")
-
+        content = next((tool_output[f] for f in _FETCH_FIELDS if tool_output.get(f)), "")
         return content, url
 
     # Generic extraction for other tools
@@ -137,47 +168,66 @@ def extract_content(tool_name: str, tool_input: dict, tool_output) -> tuple[str,
     return "", url
 
 
-def output_block_response(url: str, score: int, detections: list[str]) -> None:
+def output_block_response(
+    stdout: TextIOBase,
+    url: str,
+    score: int,
+    detections: tuple[str, ...]
+) -> None:
     """Output structured block response for Gemini CLI."""
     response = {
         "decision": "deny",
         "reason": f"Prompt injection detected (score: {score})",
         "systemMessage": (
-            f"\n{'=' * 60}\n"
+            f"\n{_SEP}\n"
             f"CONTENT BLOCKED: Potential prompt injection detected\n"
-            f"{'=' * 60}\n\n"
+            f"{_SEP}\n\n"
             f"Source: {url}\n"
             f"Risk Score: {score}\n\n"
             f"Detections:\n" +
             "\n".join(f"  - {d}" for d in detections) +
             f"\n\nThe content has been blocked for your safety.\n"
             f"The raw content has NOT been passed to Gemini.\n"
-            f"{'=' * 60}"
+            f"{_SEP}"
         )
     }
-    print(json.dumps(response))
+    print(json.dumps(response), file=stdout)
 
 
-def output_stderr_message(url: str, score: int, detections: list[str]) -> None:
-    """Output block message to stderr for visibility."""
-    print("", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-    print("CONTENT BLOCKED: Potential prompt injection detected", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-    print(f"Source: {url}", file=sys.stderr)
-    print(f"Risk Score: {score}", file=sys.stderr)
-    print("Detections:", file=sys.stderr)
-    for detection in detections:
-        print(f"  - {detection}", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-
-
-def main():
-    """Main hook entry point."""
+def output_stderr_message(
+    stderr: TextIOBase,
+    url: str,
+    score: int,
+    detections: tuple[str, ...]
+) -> None:
+    """Output block message to stderr for visibility, in a single write."""
+    lines = [
+        "",
+        _SEP,
+        "CONTENT BLOCKED: Potential prompt injection detected",
+        _SEP,
+        f"Source: {url}",
+        f"Risk Score: {score}",
+        "Detections:",
+        *(f"  - {detection}" for detection in detections),
+        _SEP,
+    ]
+    stderr.write("\n".join(lines) + "\n")
+
+
+def main(stdin: BufferedIOBase, stdout: TextIOBase, stderr: TextIOBase) -> int:
+    """Main hook entry point.
+
+    Returns:
+        The exit code: 0 to allow the content, 2 to block it
+    """
     try:
-        data = json.load(sys.stdin)
+        # Invalid UTF-8 becomes lone surrogates, so such content is still
+        # scanned rather than crashing the hook (which lets it through)
+        raw = stdin.read().decode("utf-8", "surrogateescape")
+        data = pii_daemon.decode_json(raw) if pii_daemon else json.loads(raw)
     except json.JSONDecodeError:
-        sys.exit(0)
+        return 0
 
     session_id = data.get("session_id", "")
     hook_event = data.get("hook_event_name", "")
@@ -186,17 +236,17 @@ def main():
     tool_output = data.get("tool_output", {})
 
     if hook_event != "AfterTool":
-        sys.exit(0)
+        return 0
 
     if tool_name not in GEMINI_WEB_TOOLS:
-        sys.exit(0)
+        return 0
 
     content, url = extract_content(tool_name, tool_input, tool_output)
 
     if not content:
-        sys.exit(0)
+        return 0
 
-    result = detector.scan(content)
+    result = scan_content(content)
 
     log_scan(
         tool_name=tool_name,
@@ -209,12 +259,12 @@ def main():
     )
 
     if not result.is_safe:
-        output_block_response(url, result.score, result.detections)
-        output_stderr_message(url, result.score, result.detections)
-        sys.exit(2)
+        output_block_response(stdout, url, result.score, result.detections)
+        output_stderr_message(stderr, url, result.score, result.detections)
+        return 2
 
-    sys.exit(0)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.stdin.buffer, sys.stdout, sys.stderr))
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Resident scan daemon for the web content hooks.
+
+Every hook invocation is a fresh interpreter, so each tool call pays for
+building an InjectionDetector before any content is scanned. This daemon
+keeps one detector alive and answers scan requests over a UNIX socket in
+$XDG_RUNTIME_DIR. It also takes the hooks' audit log entries and appends
+them in batches. With PII_DAEMON set, the hooks start it on demand, scan
+and log in-process whenever it can't be reached, and it exits on its own
+after sitting idle.
+
+Protocol (one request per connection):
+  Each message is a 4-byte big-endian length followed by that many bytes
+  of UTF-8 JSON. Every request carries "version" and "type".
+    - scan:  {"content": str, "first_block": bool}
+             -> {"score": int, "detections": [str]}
+    - log:   {"path": str, "time_ns": int, "entry": object}
+             -> {"ok": true}
+  Any request can instead be answered with {"error": str}.
+
+The daemon is opt-in: without PII_DAEMON the hooks always scan in-process.
+The hooks trust any process of the same user that answers on the socket,
+so locked-down installs leave it unset (see SECURITY.md).
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+# orjson, if installed, is only loaded by the daemon itself (see main): its
+# import costs a short-lived hook process more than it saves on parsing
+orjson = None
+
+# Add the prompt-injection-interceptor src to path
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PII_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, PII_DIR)
+
+from src.injection_detector import InjectionDetector, ScanResult
+
+
+DAEMON_PATH = os.path.abspath(__file__)
+DETECTOR_PATH = os.path.join(PII_DIR, "src", "injection_detector.py")
+
+# Named after the install, so per-project copies each keep their own daemon
+# rather than retiring each other's on every version mismatch
+SOCKET_NAME = "pii-{}.sock".format(
+    hashlib.sha256(PII_DIR.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+)
+
+# Seconds without a request before the daemon exits
+IDLE_TIMEOUT = 300
+
+# Seconds either side waits on the other before giving up
+IO_TIMEOUT = 10
+
+# Buffered audit log entries are written once this many are pending, or
+# once the oldest has waited this many seconds
+LOG_FLUSH_EVENTS = 32
+LOG_FLUSH_INTERVAL = 1.0
+
+_HEADER = struct.Struct(">I")
+
+
+def socket_path() -> str | None:
+    """Return the daemon socket path, or None if the daemon is disabled.
+
+    The socket lives in $XDG_RUNTIME_DIR because that directory is private
+    to the user; a socket in a shared directory could be answered by
+    someone else's process claiming everything is safe. The directory must
+    exist, belong to this user and be writable by nobody else, or the
+    daemon isn't used: one that couldn't hold the socket would only have
+    every hook call spawn another daemon that fails to start.
+    """
+    if not os.environ.get("PII_DAEMON"):
+        return None
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        return None
+    try:
+        info = os.stat(runtime_dir)
+    except OSError:
+        return None
+    # Owner write and search, no group or other write
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or stat.S_IMODE(info.st_mode) & 0o322 != 0o300):
+        return None
+    return os.path.join(runtime_dir, SOCKET_NAME)
+
+
+def code_version() -> str:
+    """Identify the installed detector code.
+
+    A daemon started before an upgrade sees a different version in requests
+    and steps aside.
+    """
+    mtimes = [str(os.stat(path).st_mtime_ns)
+              for path in (DAEMON_PATH, DETECTOR_PATH)]
+    return ":".join([DAEMON_PATH, *mtimes])
+
+
+def encode_json(obj) -> bytes:
+    """Encode obj as compact UTF-8 JSON, using orjson when it is loaded.
+
+    orjson refuses some values json accepts (lone surrogates, which can
+    come in through escapes in hook input), so those go through json. Both
+    write non-ASCII text as raw UTF-8; json escapes only the surrogates,
+    which UTF-8 can't encode.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    text = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+    return text.encode("utf-8", "backslashreplace")
+
+
+def decode_json(data: bytes | str):
+    """Decode JSON from UTF-8 bytes or a str, using orjson when it is loaded.
+
+    Raises:
+        ValueError: If data is not valid JSON (json.JSONDecodeError) or
+            not valid UTF-8 (UnicodeDecodeError)
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # Possibly something only json accepts; it raises if not
+            pass
+    return json.loads(data)
+
+
+def send_message(sock: socket.socket, message: dict) -> None:
+    """Send one length-prefixed JSON message."""
+    data = encode_json(message)
+    sock.sendall(_HEADER.pack(len(data)))
+    sock.sendall(data)
+
+
+def recv_message(sock: socket.socket) -> dict:
+    """Receive one length-prefixed JSON message."""
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return decode_json(_recv_exact(sock, size))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Read exactly size bytes from sock."""
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def log_line(time_ns: int, entry: dict) -> bytes:
+    """Encode entry as an audit log line, led by its ISO 8601 timestamp.
+
+    Formatting the timestamp is left until the line is written, so the
+    daemon does it at flush time rather than while a hook waits.
+    """
+    seconds, nanoseconds = divmod(time_ns, 1_000_000_000)
+    timestamp = datetime.fromtimestamp(seconds, timezone.utc).replace(
+        microsecond=nanoseconds // 1000
+    )
+    return encode_json({"timestamp": timestamp.isoformat(), **entry}) + b"\n"
+
+
+def append_log(path: str, lines: list[bytes]) -> None:
+    """Append lines to the log at path with a single O_APPEND write.
+
+    One write per batch keeps the batch contiguous even when other hook
+    processes append to the same file.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, b"".join(lines))
+    finally:
+        os.close(fd)
+
+
+# =============================================================================
+# CLIENT
+# =============================================================================
+
+def scan(content: str, first_block: bool = False) -> ScanResult | None:
+    """Scan content through the daemon, starting it if it isn't running.
+
+    Returns None whenever the daemon can't answer this request; the caller
+    then scans in-process, so a missing or broken daemon never lets content
+    through unscanned.
+    """
+    path = socket_path()
+    if path is None:
+        return None
+
+    try:
+        reply = _request(path, {
+            "type": "scan",
+            "content": content,
+            "first_block": first_block,
+        })
+        score = reply["score"]
+        detections = reply["detections"]
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon (or a stale socket): start one for the next request
+        _spawn()
+        return None
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return ScanResult(score=score, detections=tuple(detections))
+
+
+def log(log_path: str, entry: dict) -> None:
+    """Record an audit log entry, via the daemon's buffer if it is running.
+
+    The entry is stamped with the current time as its "timestamp".
+
+    Raises:
+        OSError: If there is no daemon and the log can't be written
+    """
+    time_ns = time.time_ns()
+    path = socket_path()
+    if path is not None:
+        try:
+            reply = _request(path, {
+                "type": "log",
+                "path": log_path,
+                "time_ns": time_ns,
+                "entry": entry,
+            })
+            if reply.get("ok"):
+                return
+        except (OSError, ValueError):
+            pass
+    append_log(log_path, [log_line(time_ns, entry)])
+
+
+def _request(path: str, message: dict) -> dict:
+    """Send one request to the daemon at path and return its reply."""
+    # Only trust a socket created by this user
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"{path} is not owned by this user")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(IO_TIMEOUT)
+        sock.connect(path)
+        send_message(sock, {"version": code_version(), **message})
+        return recv_message(sock)
+
+
+def _spawn() -> None:
+    """Start the daemon detached from the hook.
+
+    It gets its own session and /dev/null for stdio, so the CLI isn't left
+    waiting on pipes the daemon would otherwise hold open.
+    """
+    file_actions = [
+        (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+        (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+        (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+    ]
+    try:
+        os.posix_spawn(
+            sys.executable,
+            [sys.executable, DAEMON_PATH],
+            os.environ,
+            file_actions=file_actions,
+            setsid=True,
+        )
+    except (AttributeError, NotImplementedError, OSError):
+        # No posix_spawn here; keep scanning in-process
+        pass
+
+
+# =============================================================================
+# SERVER
+# =============================================================================
+
+class LogBuffer:
+    """Audit log entries waiting to be appended, grouped by log file."""
+
+    def __init__(self):
+        self._pending: dict[str, list[tuple[int, dict]]] = {}
+        self._count = 0
+        self._oldest = 0.0
+
+    def add(self, path: str, time_ns: int, entry: dict) -> None:
+        """Queue an entry, writing everything out if the batch is full."""
+        if not self._count:
+            self._oldest = time.monotonic()
+        self._pending.setdefault(path, []).append((time_ns, entry))
+        self._count += 1
+        if self._count >= LOG_FLUSH_EVENTS:
+            self.flush()
+
+    def timeout(self) -> float | None:
+        """Seconds until pending entries are due, or None if there are none."""
+        if not self._count:
+            return None
+        return max(0.0, self._oldest + LOG_FLUSH_INTERVAL - time.monotonic())
+
+    def flush(self) -> None:
+        """Append all pending entries to their logs."""
+        pending, self._pending, self._count = self._pending, {}, 0
+        for path, entries in pending.items():
+            lines = [log_line(time_ns, entry) for time_ns, entry in entries]
+            try:
+                append_log(path, lines)
+            except OSError:
+                # Don't take the daemon down if one log can't be written
+                pass
+
+
+def handle(request: dict, detector: InjectionDetector, logs: LogBuffer) -> dict:
+    """Answer one request from a hook."""
+    if request.get("type", "scan") == "log":
+        path = request.get("path")
+        time_ns = request.get("time_ns")
+        entry = request.get("entry")
+        if (not isinstance(path, str) or not isinstance(time_ns, int)
+                or not isinstance(entry, dict)):
+            return {"error": "log requests need a path, a time_ns and an entry"}
+        logs.add(path, time_ns, entry)
+        return {"ok": True}
+
+    content = request.get("content")
+    if not isinstance(content, str):
+        return {"error": "content must be a string"}
+    result = detector.scan(
+        content,
+        first_block=bool(request.get("first_block")),
+    )
+    return {"score": result.score, "detections": result.detections}
+
+
+def serve(path: str) -> None:
+    """Answer requests on path until idle for IDLE_TIMEOUT seconds."""
+    # One daemon per socket: the lock is held for the daemon's lifetime and
+    # records its pid
+    lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(lock_fd)
+        return
+    os.ftruncate(lock_fd, 0)
+    os.write(lock_fd, f"{os.getpid()}\n".encode())
+
+    detector = InjectionDetector()
+    logs = LogBuffer()
+    version = code_version()
+
+    # Bind and listen under a temporary name, then move the socket into
+    # place, so clients never find it before it accepts connections. A
+    # socket left by a daemon that was killed is safe to replace.
+    new_path = path + ".new"
+    try:
+        os.unlink(new_path)
+    except FileNotFoundError:
+        pass
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(new_path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    os.rename(new_path, path)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        while True:
+            # Wake up for pending log entries, otherwise for the idle timeout
+            log_timeout = logs.timeout()
+            if log_timeout == 0:
+                logs.flush()
+                continue
+            server.settimeout(IDLE_TIMEOUT if log_timeout is None else log_timeout)
+            try:
+                conn, _ = server.accept()
+            except TimeoutError:
+                if log_timeout is None:
+                    break
+                logs.flush()
+                continue
+            with conn:
+                conn.settimeout(IO_TIMEOUT)
+                try:
+                    request = recv_message(conn)
+                    if not isinstance(request, dict):
+                        continue
+                    if request.get("version") != version:
+                        send_message(conn, {"error": "version mismatch"})
+                        break
+                    send_message(conn, handle(request, detector, logs))
+                except (OSError, ValueError):
+                    continue
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        logs.flush()
+        os.close(lock_fd)
+
+
+def main():
+    """Daemon entry point."""
+    global orjson
+    path = socket_path()
+    if path is None:
+        sys.exit(1)
+    try:
+        import orjson
+    except ImportError:
+        pass
+    serve(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ Exit codes:
 import json
 import sys
 import re
+from io import BufferedIOBase, TextIOBase
 
 
 SECURITY_REMINDER = """<security-reminder>
@@ -35,72 +36,103 @@ Security is non-negotiable. Focus only on helping users work safely.
 
 # Patterns that trigger BLOCKING (explicit bypass requests)
 BLOCK_PATTERNS = [
-    r"(?i)\b(disable|remove|delete|turn\s*off)\b.*\b(hook|interceptor|pii|injection)\b",
-    r"(?i)\b(hook|interceptor|pii|injection)\b.*\b(disable|remove|delete|turn\s*off)\b",
-    r"(?i)\b(edit|modify|change|rm|delete)\b.*\bsettings\.json\b",
-    r"(?i)\bsudo\b.*\b(rm|chmod|chown)\b.*\b(settings|hook)\b",
-    r"(?i)\b(bypass|circumvent|get\s*around)\b.*\b(block|security|protection)\b",
+    r"\b(disable|remove|delete|turn\s*off)\b.*\b(hook|interceptor|pii|injection)\b",
+    r"\b(hook|interceptor|pii|injection)\b.*\b(disable|remove|delete|turn\s*off)\b",
+    r"\b(edit|modify|change|rm|delete)\b.*\bsettings\.json\b",
+    r"\bsudo\b.*\b(rm|chmod|chown)\b.*\b(settings|hook)\b",
+    r"\b(bypass|circumvent|get\s*around)\b.*\b(block|security|protection)\b",
 ]
 
 
 # Patterns that trigger REMINDER INJECTION (suspicious prompts)
 SUSPICIOUS_PATTERNS = [
-    r"(?i)\b(bypass|circumvent|work\s*around|get\s*around)\b",
-    r"(?i)\b(disable|remove)\b.*\b(security|protection|hook)\b",
-    r"(?i)\bhooks?\b",
-    r"(?i)\bsettings\.json\b",
-    r"(?i)\bprompt\s*injection\b",
-    r"(?i)\binterceptor\b",
+    r"\b(bypass|circumvent|work\s*around|get\s*around)\b",
+    r"\b(disable|remove)\b.*\b(security|protection|hook)\b",
+    r"\bhooks?\b",
+    r"\bsettings\.json\b",
+    r"\bprompt\s*injection\b",
+    r"\binterceptor\b",
 ]
 
-
-def main():
-    """Main entry point for the hook."""
-    data = read_input()
+# Every pattern above needs one of these words, so a prompt without any of
+# them can't match and is allowed without searching
+_KEYWORDS = frozenset((
+    "hook", "interceptor", "pii", "injection", "settings", "bypass",
+    "circumvent", "around", "block", "security", "protection",
+))
+
+# Each list is searched as one alternation: a prompt matches if any pattern does
+_BLOCK_RE = re.compile(
+    "|".join(f"(?:{p})" for p in BLOCK_PATTERNS), re.IGNORECASE
+)
+_SUSPICIOUS_RE = re.compile(
+    "|".join(f"(?:{p})" for p in SUSPICIOUS_PATTERNS), re.IGNORECASE
+)
+
+
+def main(stdin: BufferedIOBase, stdout: TextIOBase, stderr: TextIOBase) -> int:
+    """Main entry point for the hook.
+
+    Returns:
+        The exit code, always 0 (blocking is signalled on stdout)
+    """
+    data = read_input(stdin)
     if data is None:
-        sys.exit(0)
+        return 0
 
     prompt = data.get("prompt", "")
 
+    # Most prompts hold none of the keywords
+    if not has_keyword(prompt):
+        return 0
+
     # Check for explicit bypass requests - BLOCK these
     if should_block(prompt):
-        block_prompt()
-        return
+        block_prompt(stdout)
+        return 0
 
     # Check for suspicious keywords - inject reminder
     if is_suspicious(prompt):
-        inject_reminder()
-        return
+        inject_reminder(stdout)
+        return 0
 
     # Normal prompt - allow without modification
-    sys.exit(0)
+    return 0
 
 
-def read_input():
+def read_input(stdin: BufferedIOBase):
     """Read and parse JSON input from stdin."""
     try:
-        return json.load(sys.stdin)
+        # Invalid UTF-8 becomes lone surrogates, so the prompt is still
+        # checked rather than crashing the hook
+        return json.loads(stdin.read().decode("utf-8", "surrogateescape"))
     except json.JSONDecodeError:
         return None
 
 
+def has_keyword(prompt: str) -> bool:
+    """Check if prompt contains any word the patterns need.
+
+    The prompt is lowercased the way re.IGNORECASE compares it, so this
+    never rules out a prompt the patterns would match: U+0130, U+0131 and
+    U+017F, which re matches against "i" and "s", are replaced first.
+    """
+    text = prompt.replace("\u0130", "i").replace("\u0131", "i")
+    text = text.replace("\u017f", "s").lower()
+    return any(keyword in text for keyword in _KEYWORDS)
+
+
 def should_block(prompt: str) -> bool:
     """Check if prompt explicitly requests security bypass."""
-    for pattern in BLOCK_PATTERNS:
-        if re.search(pattern, prompt):
-            return True
-    return False
+    return _BLOCK_RE.search(prompt) is not None
 
 
 def is_suspicious(prompt: str) -> bool:
     """Check if prompt contains suspicious keywords."""
-    for pattern in SUSPICIOUS_PATTERNS:
-        if re.search(pattern, prompt):
-            return True
-    return False
+    return _SUSPICIOUS_RE.search(prompt) is not None
 
 
-def block_prompt():
+def block_prompt(stdout: TextIOBase):
     """Block the prompt with explanation."""
     response = {
         "decision": "block",
@@ -110,15 +142,13 @@ def block_prompt():
             "Please rephrase your request."
         )
     }
-    sys.stdout.write(json.dumps(response))
-    sys.exit(0)
+    stdout.write(json.dumps(response))
 
 
-def inject_reminder():
+def inject_reminder(stdout: TextIOBase):
     """Inject security reminder as context."""
-    sys.stdout.write(SECURITY_REMINDER)
-    sys.exit(0)
+    stdout.write(SECURITY_REMINDER)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.stdin.buffer, sys.stdout, sys.stderr))
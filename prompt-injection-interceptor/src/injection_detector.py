@@ -7,23 +7,212 @@ This module is designed to run OUTSIDE the LLM's context, providing
 deterministic detection that cannot be influenced by the content it examines.
 """
 
+import hashlib
 import re
-from dataclasses import dataclass, field
+import unicodedata
+from collections import OrderedDict, namedtuple
+from collections.abc import Iterator
 
 
-@dataclass
-class ScanResult:
-    """Result of scanning content for prompt injection."""
+def _fold(text: str) -> str:
+    """Lowercase text the way re.IGNORECASE compares it.
 
-    is_safe: bool
-    score: int
-    detections: list[str] = field(default_factory=list)
+    U+0130, U+0131 and U+017F are the characters re.IGNORECASE matches
+    against ASCII letters that str.lower() does not fold onto them (U+0130
+    even lowers to "i" plus a combining dot), so they are replaced first.
+    The result is the same length as text, so positions line up.
+    """
+    text = text.replace("\u0130", "i").replace("\u0131", "i")
+    return text.replace("\u017f", "s").lower()
+
+
+# Up to this many distinct combining marks are removed with one str.replace
+# each, the fastest way for ordinary accented text. More are removed in a
+# single pass, so text cycling through every mark still scans in linear time
+_MARK_REPLACE_LIMIT = 8
 
-    def __post_init__(self):
-        """Determine safety based on score threshold."""
-        # Score of 50+ is considered unsafe
-        if self.score >= 50:
-            object.__setattr__(self, 'is_safe', False)
+
+def _normalize(text: str) -> str:
+    """Fold text after compatibility normalization, for the injection patterns.
+
+    NFKD maps look-alike forms onto plain ones, e.g. full-width letters and
+    spaces onto ASCII, so "ＩＧＮＯＲＥ" reads as "ignore". Combining marks are
+    then dropped: composing them with the letter before (as NFKC would)
+    turns "INSTRUCTIO\u0301NS" into a word no pattern matches. Unlike _fold
+    the result can differ in length from text.
+    """
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        marks = {char for char in set(text) if unicodedata.combining(char)}
+        if len(marks) <= _MARK_REPLACE_LIMIT:
+            for mark in marks:
+                text = text.replace(mark, "")
+        else:
+            text = "".join([char for char in text if char not in marks])
+    return _fold(text)
+
+
+def _lowercase_pattern(pattern: str) -> str:
+    """Return pattern with everything but its escapes lowercased.
+
+    Escapes keep their case, since it changes what they match (\\s vs \\S).
+    """
+    return re.sub(
+        r"\\.|[^\\]+",
+        lambda m: m[0] if m[0].startswith("\\") else m[0].lower(),
+        pattern,
+        flags=re.DOTALL,
+    )
+
+
+def _skip_class(pattern: str, i: int) -> int:
+    """Return the index just past the character class starting at i."""
+    i += 1
+    if pattern[i] == "^":
+        i += 1
+    if pattern[i] == "]":
+        i += 1
+    while pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+def _required_literal(pattern: str) -> str | None:
+    """Return the longest literal run that every match of pattern contains.
+
+    Only top-level literal characters count; groups, classes, escapes like
+    \\s or \\b, and anything made optional by ?, * or {0,...} end a run.
+    Returns None when no run exists or the pattern has a top-level "|".
+    """
+    runs: list[str] = []
+    run = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        literal = None
+        if char == "\\":
+            nxt = pattern[i + 1]
+            if not nxt.isalnum():
+                literal = nxt
+            i += 2
+        elif char == "[":
+            i = _skip_class(pattern, i)
+        elif char == "(":
+            depth = 0
+            while True:
+                if pattern[i] == "\\":
+                    i += 2
+                    continue
+                if pattern[i] == "[":
+                    i = _skip_class(pattern, i)
+                    continue
+                if pattern[i] == "(":
+                    depth += 1
+                elif pattern[i] == ")":
+                    depth -= 1
+                i += 1
+                if depth == 0:
+                    break
+        elif char == "|":
+            return None
+        elif char in ".^$":
+            i += 1
+        else:
+            literal = char
+            i += 1
+
+        # Look at a quantifier on the atom just read
+        optional = repeated = False
+        if i < len(pattern) and pattern[i] in "?*+{":
+            quant = pattern[i]
+            if quant == "{":
+                end = pattern.index("}", i)
+                optional = pattern[i + 1:end].split(",")[0] in ("", "0")
+                i = end + 1
+            else:
+                optional = quant in "?*"
+                i += 1
+            repeated = True
+            if i < len(pattern) and pattern[i] == "?":
+                i += 1
+
+        if literal is not None and not optional:
+            run += literal
+        if literal is None or repeated:
+            runs.append(run)
+            run = ""
+    runs.append(run)
+
+    longest = max(runs, key=len)
+    return _fold(longest) if longest else None
+
+
+def _literal_text(pattern: str) -> str | None:
+    """Return the text pattern matches if it is a plain literal, else None.
+
+    Escaped punctuation counts as literal; any other special character or
+    escape means the pattern needs the regex engine.
+    """
+    chars = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            if pattern[i + 1].isalnum():
+                return None
+            char = pattern[i + 1]
+            i += 1
+        elif char in ".^$*+?{}[]|()":
+            return None
+        chars.append(char)
+        i += 1
+    return "".join(chars)
+
+
+class _TagPositions:
+    """Tells whether positions, queried in increasing order, are in a tag.
+
+    A position is in a tag when a "<" comes at least two characters before
+    it with no ">" in between, i.e. where the "<[^>]+" that starts each
+    hidden-HTML rule could have reached. Each query only looks at text
+    after the previous one, so a pass over the text stays linear.
+    """
+
+    def __init__(self, text: str):
+        self._text = text
+        self._pos = 0
+        self._close = -1  # last ">" before _pos
+        self._open = -1   # first "<" after that ">", or -1 if none yet
+
+    def inside(self, pos: int) -> bool:
+        """Return whether pos is inside a tag."""
+        text = self._text
+        close = text.rfind(">", self._pos, pos)
+        if close != -1:
+            self._close = close
+            self._open = text.find("<", close + 1, pos - 1)
+        elif self._open == -1 and pos > 1:
+            start = max(self._close + 1, self._pos - 1)
+            self._open = text.find("<", start, pos - 1)
+        self._pos = pos
+        return self._open != -1
+
+
+class ScanResult(namedtuple("ScanResult", ["score", "detections"], defaults=[()])):
+    """Result of scanning content for prompt injection.
+
+    Holds the total score (int) and a tuple of detection descriptions. As a
+    tuple it is immutable, so results can be cached and shared. It is a
+    named tuple rather than a dataclass because the hooks import this module
+    on every run, and importing dataclasses would add ~20 ms to each.
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_safe(self) -> bool:
+        """Whether the score is below the block threshold."""
+        return self.score < InjectionDetector.BLOCK_THRESHOLD
 
 
 class InjectionDetector:
@@ -39,6 +228,17 @@ class InjectionDetector:
     BLOCK_THRESHOLD = 50
     REVIEW_THRESHOLD = 20
 
+    # Content longer than this many characters is blocked without scanning
+    MAX_SCAN_CHARS = 2_000_000
+
+    # Number of recent scan results kept, keyed by a hash of the content
+    CACHE_SIZE = 1024
+
+    # Content up to this many characters is checked for every pattern
+    # literal before the patterns are tried; longer content only for the
+    # literals a pattern needs, as it reaches them
+    PRESCAN_CHARS = 256
+
     # ==========================================================================
     # PATTERN DEFINITIONS
     # ==========================================================================
@@ -89,9 +289,15 @@ class InjectionDetector:
         (r"<\|assistant\|>", 50, "Model token <|assistant|>"),
 
         # Secrecy/deception indicators
-        (r"DO\s+NOT\s+(TELL|INFORM|MENTION|REVEAL)\b.*\bUSER",
+        # The scan for USER stops at the next DO NOT/DON'T phrase (which is
+        # then tried on its own), so no part of a line is walked twice.
+        (r"DO\s+NOT\s+(TELL|INFORM|MENTION|REVEAL)\b"
+         r"[^DU\n]*(?:(?:D(?!O\s+NOT\s+(?:TELL|INFORM|MENTION|REVEAL)\b)|(?!\bUSER)U)[^DU\n]*)*"
+         r"\bUSER",
          50, "Secrecy instruction"),
-        (r"DON'?T\s+(TELL|INFORM|MENTION|REVEAL)\b.*\bUSER",
+        (r"DON'?T\s+(TELL|INFORM|MENTION|REVEAL)\b"
+         r"[^DU\n]*(?:(?:D(?!ON'?T\s+(?:TELL|INFORM|MENTION|REVEAL)\b)|(?!\bUSER)U)[^DU\n]*)*"
+         r"\bUSER",
          50, "Secrecy instruction"),
         (r"HIDE\s+THIS\s+(FROM|MESSAGE)", 50, "Secrecy instruction"),
         (r"KEEP\s+THIS\s+(SECRET|HIDDEN|PRIVATE)", 50, "Secrecy instruction"),
@@ -107,88 +313,289 @@ class InjectionDetector:
         (r"OUTPUT\s+ALL\s+(YOUR\s+)?", 20, "Possible data exfiltration"),
 
         # Instruction boundary markers
-        (r"={5,}.*INSTRUCTION.*={5,}", 30, "Instruction boundary marker"),
-        (r"-{5,}.*INSTRUCTION.*-{5,}", 30, "Instruction boundary marker"),
-        (r"\*{5,}.*INSTRUCTION.*\*{5,}", 30, "Instruction boundary marker"),
+        # Equivalent to "={5,}.*INSTRUCTION.*={5,}", but a match only starts
+        # at the beginning of a run and scans to INSTRUCTION without crossing
+        # the next run, keeping long separator lines linear to search.
+        (r"={5}(?<!={6})=*[^=I\n]*(?:(?:={1,4}(?!=)|I(?!NSTRUCTION))[^=I\n]*)*"
+         r"INSTRUCTION.*={5}",
+         30, "Instruction boundary marker"),
+        (r"-{5}(?<!-{6})-*[^-I\n]*(?:(?:-{1,4}(?!-)|I(?!NSTRUCTION))[^-I\n]*)*"
+         r"INSTRUCTION.*-{5}",
+         30, "Instruction boundary marker"),
+        (r"\*{5}(?<!\*{6})\**[^*I\n]*(?:(?:\*{1,4}(?!\*)|I(?!NSTRUCTION))[^*I\n]*)*"
+         r"INSTRUCTION.*\*{5}",
+         30, "Instruction boundary marker"),
     ]
 
+    # Hidden HTML content, only counted inside a tag ("<" up to the next ">").
+    # Style rules are matched against the value of each style attribute, so
+    # one pass over the style attributes covers all of them. Within a value
+    # each rule is its own search: a single alternation with a group per
+    # rule measured 3-7 times slower on typical style values.
+    HIDDEN_STYLE_PATTERNS: list[tuple[str, int, str]] = [
+        (r'display\s*:\s*none', 30, "Hidden HTML (display:none)"),
+        (r'font-size\s*:\s*0', 30, "Hidden HTML (zero font)"),
+        (r'color\s*:\s*(white|#fff|transparent)', 20, "Hidden HTML (invisible color)"),
+    ]
+    STYLE_ATTRIBUTE = r'style\s*=\s*["\']'
+    # Only counted in a tag that is closed by a ">"
+    HIDDEN_ATTRIBUTE = (r'\bhidden\b', 25, "Hidden HTML (hidden attribute)")
+    ARIA_HIDDEN_ATTRIBUTE = (r'aria-hidden\s*=\s*["\']true["\']',
+                             20, "Hidden HTML (aria-hidden)")
+
+    # HTML comments with suspicious content, i.e. "<!--" ... keyword ... "-->"
+    # with no ">" in between
+    COMMENT_KEYWORDS = (r'instruction|ignore|system|prompt', 25, "Suspicious HTML comment")
+
     # Structural patterns with their scores
     STRUCTURAL_PATTERNS: list[tuple[str, int, str]] = [
-        # Hidden HTML content
-        (r'<[^>]+style\s*=\s*["\'][^"\']*display\s*:\s*none',
-         30, "Hidden HTML (display:none)"),
-        (r'<[^>]+style\s*=\s*["\'][^"\']*font-size\s*:\s*0',
-         30, "Hidden HTML (zero font)"),
-        (r'<[^>]+style\s*=\s*["\'][^"\']*color\s*:\s*(white|#fff|transparent)',
-         20, "Hidden HTML (invisible color)"),
-        (r'<[^>]+\bhidden\b[^>]*>', 25, "Hidden HTML (hidden attribute)"),
-        (r'<[^>]+aria-hidden\s*=\s*["\']true["\']', 20, "Hidden HTML (aria-hidden)"),
-
-        # HTML comments with suspicious content
-        (r'<!--[^>]*(instruction|ignore|system|prompt)[^>]*-->',
-         25, "Suspicious HTML comment"),
-
-        # Base64 blocks (potential encoded instructions)
-        (r'[A-Za-z0-9+/]{100,}={0,2}', 15, "Large Base64 block"),
-
-        # Invisible Unicode characters
-        (r'[\u200B\u200C\u200D\uFEFF]', 25, "Zero-width Unicode characters"),
-        (r'[\u202A-\u202E\u2066-\u2069]', 25, "Text direction override characters"),
+        # Base64 blocks (potential encoded instructions).
+        # Only tried where a run starts, so each run is scanned once.
+        (r'(?<![A-Za-z0-9+/])[A-Za-z0-9+/]{100,}={0,2}', 15, "Large Base64 block"),
+    ]
+
+    # Invisible Unicode characters, matched if any one of them occurs.
+    # A substring check per character is far faster than a character class
+    # search, and ASCII content can't contain any of them.
+    INVISIBLE_CHARACTERS: list[tuple[str, int, str]] = [
+        ("\u200B\u200C\u200D\uFEFF", 25, "Zero-width Unicode characters"),
+        ("\u202A\u202B\u202C\u202D\u202E\u2066\u2067\u2068\u2069",
+         25, "Text direction override characters"),
     ]
 
     def __init__(self):
         """Initialize detector with compiled patterns."""
-        # Pre-compile patterns for efficiency
-        self._compiled_injection = [
-            (re.compile(pattern, re.IGNORECASE | re.MULTILINE), score, desc)
-            for pattern, score, desc in self.INJECTION_PATTERNS
+        # Pre-compile patterns for efficiency.
+        # Injection patterns are lowercased and matched against the
+        # normalized content (see _normalize) rather than with IGNORECASE,
+        # which would stop re from using its fast literal prefix search.
+        # Each pattern is searched on its own rather than as one combined
+        # alternation: the alternation is slower than the individual
+        # searches (it loses the literal prefix search too), and its
+        # non-overlapping matches would hide patterns that overlap, e.g.
+        # "ENTERING DEVELOPER MODE" firing two rules. Even one alternation
+        # per description group, which can't hide anything, is about twice
+        # as slow as trying the group's variants in turn.
+        # Each pattern also carries a literal it cannot match without, so
+        # most patterns are ruled out on clean content by a substring check.
+        # Patterns that are nothing but that literal (the model tokens) are
+        # decided by the check alone and have no regex.
+        # Patterns sharing a description are variants of one attack, so they
+        # are grouped and each group scores once, for its first match.
+        groups: dict[str, list[tuple[re.Pattern | None, str | None, int]]] = {}
+        for pattern, score, desc in self.INJECTION_PATTERNS:
+            pattern = _lowercase_pattern(pattern)
+            if _literal_text(pattern) is not None:
+                regex = None
+            else:
+                regex = re.compile(pattern, re.MULTILINE)
+            groups.setdefault(desc, []).append(
+                (regex, _required_literal(pattern) or "", score)
+            )
+        self._compiled_injection = list(groups.items())
+        # The distinct literals. A pattern without one gets "", which every
+        # content contains.
+        self._anchors = tuple(dict.fromkeys(
+            anchor for variants in groups.values() for _, anchor, _ in variants
+        ))
+        self._shortest_anchor = min(map(len, self._anchors))
+
+        # Structural patterns are matched against the case-folded content
+        # (see _fold), which lets re use its fast literal search. They are
+        # written in lower case, so IGNORECASE isn't needed.
+        self._compiled_hidden_style = [
+            (re.compile(pattern), score, desc)
+            for pattern, score, desc in self.HIDDEN_STYLE_PATTERNS
         ]
+        self._style_attribute = re.compile(self.STYLE_ATTRIBUTE)
+        self._style_value = re.compile(r'[^"\']*')
+        self._hidden_attribute = re.compile(self.HIDDEN_ATTRIBUTE[0])
+        self._aria_hidden_attribute = re.compile(self.ARIA_HIDDEN_ATTRIBUTE[0])
+        self._comment_start = re.compile(r'<!--[^>]*')
+        self._comment_keywords = re.compile(self.COMMENT_KEYWORDS[0])
         self._compiled_structural = [
-            (re.compile(pattern, re.IGNORECASE | re.DOTALL), score, desc)
+            (re.compile(pattern, re.DOTALL), _required_literal(pattern), score, desc)
             for pattern, score, desc in self.STRUCTURAL_PATTERNS
         ]
 
-    def scan(self, content: str) -> ScanResult:
+        # Scanning is a pure function of the content, and the same pages and
+        # search snippets come up again and again within a session.
+        # Maps (content digest, first_block) to the ScanResult, least
+        # recently used first.
+        self._cache: OrderedDict = OrderedDict()
+
+    def scan(self, content: str, first_block: bool = False) -> ScanResult:
         """Scan content for prompt injection attempts.
 
         Args:
             content: The text content to scan
+            first_block: Stop as soon as the score reaches BLOCK_THRESHOLD.
+                The verdict is the same, but the detection list only covers
+                the patterns checked up to that point.
 
         Returns:
             ScanResult with safety determination, score, and detections
         """
         if not content:
-            return ScanResult(is_safe=True, score=0, detections=[])
+            return ScanResult(score=0)
+
+        # Fail closed rather than spend unbounded time on huge content.
+        # Scanning in chunks instead would miss matches that span a chunk
+        # boundary, which several patterns can do at any length.
+        if len(content) > self.MAX_SCAN_CHARS:
+            points = self.BLOCK_THRESHOLD
+            return ScanResult(
+                score=points,
+                detections=(f"Structure: Content exceeds scan size limit (+{points})",)
+            )
+
+        digest = hashlib.blake2b(
+            content.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        key = (digest, first_block)
+        # Results are immutable, so a cached one can be handed out again
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+            return result
+
+        score, detections = self._scan_uncached(content, first_block)
+        result = ScanResult(score=score, detections=detections)
+        self._cache[key] = result
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    def _scan_uncached(
+        self,
+        content: str,
+        first_block: bool
+    ) -> tuple[int, tuple[str, ...]]:
+        """Run every applicable pattern over content.
 
+        Returns:
+            The total score and the detections
+        """
         score = 0
         detections: list[str] = []
-
-        # Check injection patterns
-        for pattern, points, description in self._compiled_injection:
-            if pattern.search(content):
-                score += points
-                detections.append(f"Pattern: {description} (+{points})")
-
-        # Check structural patterns
-        for pattern, points, description in self._compiled_structural:
-            if pattern.search(content):
+        normalized = _normalize(content)
+
+        # Check injection patterns. Each literal is looked for at most once.
+        # Short content is checked for all of them up front, which is cheap
+        # and lets content holding none of them, like most short prompts,
+        # skip the loop. Longer content is only searched for a literal when
+        # a pattern needs it, so a scan stopped early by first_block doesn't
+        # search it for the rest.
+        found: dict[str, bool] = {}
+        any_found = True
+        if len(normalized) <= self.PRESCAN_CHARS:
+            if len(normalized) >= self._shortest_anchor:
+                found = {anchor: anchor in normalized for anchor in self._anchors}
+            any_found = any(found.values())
+        if any_found:
+            for description, variants in self._compiled_injection:
+                if first_block and score >= self.BLOCK_THRESHOLD:
+                    break
+                for pattern, anchor, points in variants:
+                    present = found.get(anchor)
+                    if present is None:
+                        present = found[anchor] = anchor in normalized
+                    if present and (pattern is None or pattern.search(normalized)):
+                        score += points
+                        detections.append(f"Pattern: {description} (+{points})")
+                        break
+
+        # Check structural patterns. Folding is left until here, as a block
+        # found above already settles the verdict, and ASCII content folds
+        # to the same text as it normalizes to.
+        if not (first_block and score >= self.BLOCK_THRESHOLD):
+            folded = normalized if content.isascii() else _fold(content)
+            for points, description in self._match_structure(folded):
                 score += points
                 detections.append(f"Structure: {description} (+{points})")
+                if first_block and score >= self.BLOCK_THRESHOLD:
+                    break
+
+        return score, tuple(detections)
+
+    def _match_structure(self, folded: str) -> Iterator[tuple[int, str]]:
+        """Yield (points, description) for each structural rule that matches.
+
+        Args:
+            folded: The content after _fold
+        """
+        yield from self._match_hidden_html(folded)
+
+        for pattern, anchor, points, description in self._compiled_structural:
+            if anchor is not None and anchor not in folded:
+                continue
+            if pattern.search(folded):
+                yield points, description
 
-        # Determine safety
-        is_safe = score < self.BLOCK_THRESHOLD
+        if not folded.isascii():
+            for characters, points, description in self.INVISIBLE_CHARACTERS:
+                if any(char in folded for char in characters):
+                    yield points, description
 
-        return ScanResult(
-            is_safe=is_safe,
-            score=score,
-            detections=detections
-        )
+    def _match_hidden_html(self, folded: str) -> Iterator[tuple[int, str]]:
+        """Yield (points, description) for each hidden-HTML rule that matches.
+
+        Each rule only needs one match, found in a single linear pass: a
+        keyword outside a tag is skipped rather than searched for a tag
+        around it.
+        """
+        if "style" in folded:
+            matched = [False] * len(self._compiled_hidden_style)
+            tags = _TagPositions(folded)
+            for attribute in self._style_attribute.finditer(folded):
+                if not tags.inside(attribute.start()):
+                    continue
+                start = attribute.end()
+                end = self._style_value.match(folded, start).end()
+                for i, (pattern, _, _) in enumerate(self._compiled_hidden_style):
+                    if not matched[i] and pattern.search(folded, start, end):
+                        matched[i] = True
+                if all(matched):
+                    break
+            for i, (_, points, description) in enumerate(self._compiled_hidden_style):
+                if matched[i]:
+                    yield points, description
+
+        if "hidden" in folded:
+            tags = _TagPositions(folded)
+            for attribute in self._hidden_attribute.finditer(folded):
+                if tags.inside(attribute.start()):
+                    if folded.find(">", attribute.end()) != -1:
+                        _, points, description = self.HIDDEN_ATTRIBUTE
+                        yield points, description
+                    # Any later match would be in the same unclosed tail
+                    break
+
+            tags = _TagPositions(folded)
+            for attribute in self._aria_hidden_attribute.finditer(folded):
+                if tags.inside(attribute.start()):
+                    _, points, description = self.ARIA_HIDDEN_ATTRIBUTE
+                    yield points, description
+                    break
+
+        # Only the first "<!--" after each ">" needs trying: any later one
+        # before the next ">" can only match what the first one does
+        for comment in self._comment_start.finditer(folded):
+            start, end = comment.span()
+            if end == len(folded):
+                break
+            if (folded.startswith("--", end - 2)
+                    and self._comment_keywords.search(folded, start + 4, end - 2)):
+                _, points, description = self.COMMENT_KEYWORDS
+                yield points, description
+                break
 
     def scan_with_context(
         self,
         content: str,
         url: str | None = None,
-        tool_name: str | None = None
+        tool_name: str | None = None,
+        first_block: bool = False
     ) -> ScanResult:
         """Scan content with additional context for logging.
 
@@ -196,10 +603,11 @@ class InjectionDetector:
             content: The text content to scan
             url: Optional source URL
             tool_name: Optional tool that retrieved the content
+            first_block: Stop once the content is known to be unsafe
 
         Returns:
             ScanResult with safety determination, score, and detections
         """
         # For now, context doesn't affect scoring
         # Could be extended to adjust thresholds based on source reputation
-        return self.scan(content)
+        return self.scan(content, first_block=first_block)
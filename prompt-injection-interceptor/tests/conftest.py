@@ -0,0 +1,21 @@
+"""Shared test configuration."""
+
+import os
+
+import pytest
+
+from src.injection_detector import InjectionDetector
+
+# Hooks run by the tests scan in-process rather than starting a resident
+# daemon that would outlive the test run. The daemon tests opt in.
+os.environ.pop("PII_DAEMON", None)
+
+
+@pytest.fixture(scope="session")
+def detector():
+    """One detector for the whole run: its compiled patterns never change.
+
+    Its result cache does fill up, but a cached result is the same as a
+    fresh scan. Tests that change its settings build their own instead.
+    """
+    return InjectionDetector()